@@ -0,0 +1,76 @@
+import os
+import re
+import glob
+import fnmatch
+
+
+def find_paths(pattern: str, only_dirs: bool=False):
+    """Yield the paths that match the given pattern.
+
+    Parameters
+    ----------
+    pattern : str
+        Unix shell style wildcard pattern.
+        Pattern that ends with a separator only matches directories.
+    only_dirs : bool
+        If True, only directories are yielded.
+        If False, files and directories are yielded.
+        By default, files and directories are yielded.
+
+    Yields
+    ------
+    path : str
+        Path that matches the pattern.
+
+    Notes
+    -----
+    Same as `glob.iglob` (without the recursive `**`), except that each directory is listed only
+    once with `os.scandir` and the file types cached in the directory entries are used to prune
+    the search, rather than calling `stat` on each intermediate path.
+
+    """
+    components = [component for component in pattern.split(os.sep) if component]
+    if not components:
+        return
+    matchers = [re.compile(fnmatch.translate(component)).match if glob.has_magic(component)
+                else None for component in components]
+    root = os.sep if os.path.isabs(pattern) else ''
+    only_dirs = only_dirs or pattern.endswith(os.sep)
+    yield from _walk(root, components, matchers, 0, only_dirs)
+
+
+def _walk(dirname: str, components: list, matchers: list, depth: int, only_dirs: bool):
+    """Yield the paths below the given directory that match the remaining pattern components.
+
+    See `find_paths` for details.
+
+    """
+    component, matcher = components[depth], matchers[depth]
+    is_last = depth == len(components) - 1
+    # component without wildcards
+    if matcher is None:
+        path = os.path.join(dirname, component)
+        if not is_last:
+            if os.path.isdir(path):
+                yield from _walk(path, components, matchers, depth + 1, only_dirs)
+        elif os.path.isdir(path) if only_dirs else os.path.lexists(path):
+            yield path
+        return
+
+    try:
+        with os.scandir(dirname or os.curdir) as it:
+            entries = list(it)
+    except OSError:
+        return
+    for entry in entries:
+        # hidden files are only matched explicitly
+        if entry.name[0] == '.' and component[0] != '.':
+            continue
+        if not matcher(entry.name):
+            continue
+        path = os.path.join(dirname, entry.name)
+        if not is_last:
+            if entry.is_dir():
+                yield from _walk(path, components, matchers, depth + 1, only_dirs)
+        elif not only_dirs or entry.is_dir():
+            yield path
@@ -1,4 +1,5 @@
 import os
+import functools
 
 
 def parse_gbs(gbs_file: str):
@@ -55,6 +56,49 @@ def get_gen(basis: str, atoms: list):
     return '\n****\n'.join(gbs_dict[atom] for atom in set(atoms)) + '\n****\n'
 
 
+@functools.lru_cache(maxsize=None)
+def _com_parts(basis: str, atoms: frozenset, chkfile: str, memory: str, route: str, charge: int,
+               multiplicity: int, gbs_mtime):
+    """Make the parts of the Gaussian com file that do not depend on the title and the xyz.
+
+    Parameters
+    ----------
+    atoms : frozenset of str
+        Atoms in the molecule.
+    gbs_mtime : {int, None}
+        Modification time of the gbs file so that the cache is not used once it has changed.
+
+    See `make_com` for the other parameters.
+
+    Returns
+    -------
+    before_title : str
+        Part of the file before the title.
+    before_xyz : str
+        Part of the file between the title and the xyz.
+    after_xyz : str
+        Part of the file after the xyz.
+
+    """
+    before_title = f'%chk={chkfile}\n'
+    before_title += f'%mem={memory}\n'
+    before_title += f'{route}\n'
+    before_title += '\n'
+
+    before_xyz = '\n'
+    before_xyz += '\n'
+    before_xyz += f'{charge:d} {multiplicity:d}\n'
+
+    after_xyz = '\n'
+    after_xyz += '\n'
+    # make gen part
+    gen = get_gen(basis, atoms)
+    after_xyz += f'{gen}'
+    after_xyz += '\n\n\n'
+
+    return before_title, before_xyz, after_xyz
+
+
 def make_com(xyz, basis, chkfile='temp.chk', memory='3gb', route=None, title='', charge=0,
              multiplicity=1):
     """Make a Gaussian com file.
@@ -79,24 +123,21 @@ def make_com(xyz, basis, chkfile='temp.chk', memory='3gb', route=None, title='',
         Spin multiplicity of the molecule.
         Singlet is 1, doublet is 2, triplet is 3, etc.
 
+    Notes
+    -----
+    Everything other than the title and the xyz is cached for the given options (and atoms), so
+    that the gbs file is only parsed once when making many com files.
+
     """
     if route is None:
         route = '#p rhf/gen scf=(tight,xqc,fermi) integral=grid=ultrafine nosymmetry units=AU'
-    output = f'%chk={chkfile}\n'
-    output += f'%mem={memory}\n'
-    output += f'{route}\n'
-    output += '\n'
-    output += f'{title}\n'
-    output += '\n'
-    output += f'{charge:d} {multiplicity:d}\n'
-    output += f'{xyz}\n'
-    output += '\n'
-
     # extract out atoms
-    atoms = xyz.split()[::4]
-    # make gen part
-    gen = get_gen(basis, atoms)
-    output += f'{gen}'
-    output += '\n\n\n'
-
-    return output
+    atoms = frozenset(xyz.split()[::4])
+    try:
+        gbs_mtime = os.stat(basis + '.gbs').st_mtime_ns
+    except FileNotFoundError:
+        # get_gen will raise the error
+        gbs_mtime = None
+    before_title, before_xyz, after_xyz = _com_parts(basis, atoms, chkfile, memory, route, charge,
+                                                     multiplicity, gbs_mtime)
+    return f'{before_title}{title}{before_xyz}{xyz}{after_xyz}'
@@ -1,4 +1,6 @@
+import os
 import re
+import functools
 import numpy as np
 
 
@@ -74,6 +76,25 @@ def parse_xyz(xyz_file: str):
     return all_titles, all_atoms, all_coords
 
 
+@functools.lru_cache(maxsize=None)
+def _parse_template(xyz_file: str, mtime: int):
+    """Parse the template xyz file.
+
+    Parameters
+    ----------
+    xyz_file : str
+        XYZ file.
+    mtime : int
+        Modification time of the file (in ns) so that the cache is not used once it has changed.
+
+    Returns
+    -------
+    See `parse_xyz`.
+
+    """
+    return parse_xyz(xyz_file)
+
+
 def xyz_from_templates(start_template, end_template, num_divisions: int=10):
     """Yield xyz from one template to another.
 
@@ -89,8 +110,9 @@ def xyz_from_templates(start_template, end_template, num_divisions: int=10):
         Coordinates at each step.
 
     """
-    _, start_atoms, start_coords = parse_xyz(start_template)
-    _, end_atoms, end_coords = parse_xyz(end_template)
+    _, start_atoms, start_coords = _parse_template(start_template,
+                                                   os.stat(start_template).st_mtime_ns)
+    _, end_atoms, end_coords = _parse_template(end_template, os.stat(end_template).st_mtime_ns)
     if not (len(start_atoms) == 1 and len(start_coords) == 1):
         raise ValueError('Template for the starting point contains more than one set of '
                          'coordiantes.')
@@ -1,8 +1,105 @@
-import glob
 import re
 import os
 import fnmatch
+from concurrent.futures import ThreadPoolExecutor
 import numpy as np
+from find_paths import find_paths
+
+
+# statuses in order of precedence (a file that matches several is assigned to the first)
+_STATUSES = ('success', 'opt_failed', 'code_failed', 'no_time')
+_RE_STATUS = re.compile(
+    rb'(?P<success>Optimization was successful)'
+    rb'|(?P<opt_failed>Optimization was not successful: )'
+    rb'|(?P<code_failed>Traceback \(most recent call last\):)'
+    rb'|(?P<no_time>slurmstepd: error: \*\*\* JOB .+ ON .+ CANCELLED AT .+ DUE TO TIME LIMIT)'
+)
+# statuses of the calculations that have results (in the order they are returned)
+_RESULT_STATUSES = ('success', 'running', 'no_time')
+_RE_NUC = re.compile(rb'Nuclear-nuclear repulsion: (.+)')
+_RE_ENERGY = re.compile(rb'Final Energy: (.+)')
+
+# columns of the results from `extract_results`
+_COLUMNS = ('system', 'basis', 'orbital', 'wfn', 'index', 'filename', 'energy', 'nuc_nuc', 'sigma')
+_FLOAT_COLUMNS = ('energy', 'nuc_nuc', 'sigma')
+
+# number of threads used to read the files (the GIL is released while reading)
+_MAX_WORKERS = min(32, (os.cpu_count() or 1) * 4)
+
+
+def _read_head_tail(filename: str, head=8192, tail=65536):
+    """Read the beginning and the end of the given file.
+
+    Parameters
+    ----------
+    filename : str
+        Name of the file.
+    head : int
+        Number of bytes read from the beginning of the file.
+    tail : int
+        Number of bytes read from the end of the file.
+
+    Returns
+    -------
+    head_contents : bytes
+        Beginning of the file.
+    tail_contents : bytes
+        End of the file.
+
+    Notes
+    -----
+    If the file is not larger than `head + tail` bytes, both the head and the tail are the whole
+    contents of the file.
+
+    """
+    with open(filename, 'rb') as f:
+        size = f.seek(0, os.SEEK_END)
+        f.seek(0)
+        if size <= head + tail:
+            contents = f.read()
+            return contents, contents
+        head_contents = f.read(head)
+        f.seek(-tail, os.SEEK_END)
+        tail_contents = f.read()
+    return head_contents, tail_contents
+
+
+def _status_of(contents: bytes):
+    """Get the status of the calculation from the end of its output file.
+
+    Parameters
+    ----------
+    contents : bytes
+        End of the output file.
+
+    Returns
+    -------
+    tag : str
+        One of `success`, `opt_failed`, `code_failed`, `no_time`, and `running`.
+
+    """
+    # single pass over the contents for all of the status messages
+    found = {match.lastgroup for match in _RE_STATUS.finditer(contents)}
+    return next((tag for tag in _STATUSES if tag in found), 'running')
+
+
+def _classify(filename: str):
+    """Get the status of the calculation from its output file.
+
+    Parameters
+    ----------
+    filename : str
+        Name of the output file.
+
+    Returns
+    -------
+    tag : str
+        One of `success`, `opt_failed`, `code_failed`, `no_time`, and `running`.
+
+    """
+    # status messages are written at the end of the file
+    _, tail = _read_head_tail(filename)
+    return _status_of(tail)
 
 
 def status(pattern: str):
@@ -14,28 +111,85 @@ def status(pattern: str):
         Unix shell style wildcard pattern to find the calculations.
 
     """
-    success = []
-    opt_failed = []
-    code_failed = []
-    no_time = []
-    running = []
-    for filename in glob.glob(pattern):
-        with open(filename, 'r') as f:
-            results = f.read()
-
-        if re.search('Optimization was successful', results):
-            success.append(filename)
-        elif re.search('Optimization was not successful: ', results):
-            opt_failed.append(filename)
-        elif re.search('Traceback (most recent call last):', results):
-            code_failed.append(filename)
-        elif re.search(r'slurmstepd: error: \*\*\* JOB .+ ON .+ CANCELLED AT .+ DUE TO TIME LIMIT',
-                       results):
-            no_time.append(filename)
+    buckets = {tag: [] for tag in _STATUSES + ('running',)}
+    filenames = list(find_paths(pattern))
+    with ThreadPoolExecutor(max_workers=_MAX_WORKERS) as executor:
+        for filename, tag in zip(filenames, executor.map(_classify, filenames)):
+            buckets[tag].append(filename)
+
+    return (buckets['success'], buckets['opt_failed'], buckets['code_failed'], buckets['no_time'],
+            buckets['running'])
+
+
+def _scan_one(path: str):
+    """Get the status and the results of one calculation.
+
+    Output files are read only once for both the status and the results.
+
+    Parameters
+    ----------
+    path : str
+        Path to the output (`.out`) or the HF energies (`.npy`) file, relative to the current
+        directory.
+
+    Returns
+    -------
+    tag : str
+        Status of the calculation (see `status`).
+        HF energies are always `success`.
+    result : {tuple, None}
+        Results of the calculation, in the order of `_COLUMNS`.
+        None if the calculation failed or has not produced any results yet.
+
+    """
+    split_filename = path.split(os.sep)
+    index = ''
+    sigma = 0.0
+    if len(split_filename) == 6:
+        head, tail = _read_head_tail(path)
+        tag = _status_of(tail)
+        if tag not in _RESULT_STATUSES or tail == b'':
+            return tag, None
+
+        _, system_basis, orbital, wfn, index, filename = split_filename
+
+        # nuclear repulsion is printed at the start and the energy at the end
+        re_nuc = _RE_NUC.search(head)
+        if re_nuc is None:
+            with open(path, 'rb') as f:
+                re_nuc = _RE_NUC.search(f.read())
+        nuc_nuc = float(re_nuc.group(1))
+
+        if tag == 'success':
+            re_energy = _RE_ENERGY.search(tail)
+            if re_energy is None:
+                with open(path, 'rb') as f:
+                    re_energy = _RE_ENERGY.search(f.read())
+            energy = float(re_energy.group(1))
         else:
-            running.append(filename)
+            # last complete progress line of the optimization (before the message of Slurm, if
+            # cancelled), since the output of a running job can end in the middle of a line
+            lastline = next((line for line in reversed(tail.split(b'\n')[:-1])
+                             if line.strip() and not line.startswith(b'slurmstepd:')), b'')
+            if b'Iterat' in lastline:
+                return tag, None
+            try:
+                _, _, energy, _, sigma, *_ = lastline.split()
+                energy, sigma = float(energy), float(sigma)
+            except ValueError:
+                # line is not a progress line (e.g. the output was cut off)
+                return tag, None
+
+    elif len(split_filename) == 4:
+        tag = 'success'
+        energy, nuc_nuc = np.load(path)
 
-    return success, opt_failed, code_failed, no_time, running
+        _, system_basis, orbital, filename = split_filename
+        wfn = 'hf'
+    else:
+        raise NotImplementedError(f'Unsupported file/directory: {path}')
+    system, basis = system_basis.rsplit('_', 1)
+    return tag, (system, basis, orbital, wfn, index, filename, energy, nuc_nuc, sigma)
 
 
 def extract_results(pattern: str):
@@ -46,69 +200,40 @@ def extract_results(pattern: str):
     pattern : str
         Unix shell style wildcard pattern to find the calculations.
 
+    Returns
+    -------
+    results : dict of str to np.ndarray
+        Columns `system`, `basis`, `orbital`, `wfn`, `index`, `filename` (str), and `energy`,
+        `nuc_nuc`, and `sigma` (float) of the results, where each row corresponds to a
+        calculation.
+        Calculations without an index (HF) have an empty `index` and calculations that have
+        finished have a `sigma` of zero.
+
     """
-    if pattern[-4:] == '.out':
-        filenames, *_, no_time, running = status(pattern)
-    elif pattern[-4:] == '.npy':
-        filenames = glob.glob(pattern)
-        running = []
-
-    cwd = os.getcwd()
-    output = []
-    for i, filename in enumerate(filenames + running + no_time):
-        if i >= len(filenames):
-            is_complete = False
-        else:
-            is_complete = True
-
-        filename = os.path.abspath(filename)
-        if os.path.commonpath([cwd, filename]) != cwd:
-            continue
-        filename = filename[len(cwd)+1:]
-
-        split_filename = filename.split(os.sep)
-        dict_calc = {}
-        if len(split_filename) == 6:
-            with open(filename, 'r') as f:
-                results = f.read()
-            if results == '':
+    cwd_prefix = os.getcwd() + os.sep
+    paths = []
+    for filename in find_paths(pattern):
+        # only keep the files within the current directory (relative to it)
+        if os.path.isabs(filename):
+            if not filename.startswith(cwd_prefix):
                 continue
-
-            _, system_basis, orbital, wfn, index, filename = split_filename
-            dict_calc['wfn'] = wfn
-            dict_calc['index'] = index
-
-            re_nuc = re.search(r'Nuclear-nuclear repulsion: (.+)', results)
-            nuc_nuc = re_nuc.group(1)
-
-            if is_complete:
-                re_energy = re.search(r'Final Energy: (.+)', results)
-                energy = re_energy.group(1)
-            else:
-                lastline = re.split(r'\n', results)[-2]
-                if 'Iterat' in lastline:
-                    continue
-                _, _, _, energy, _, sigma, *_ = re.split(r'\s+', lastline)
-                dict_calc['sigma'] = sigma
-
-        elif len(split_filename) == 4:
-            energy, nuc_nuc = np.load(filename)
-
-            _, system_basis, orbital, filename = split_filename
-            dict_calc['wfn'] = 'hf'
+            filename = filename[len(cwd_prefix):]
         else:
-            raise NotImplementedError(f'Unsupported file/directory: {filename}')
-        system, basis = system_basis.rsplit('_', 1)
-        dict_calc['system'] = system
-        dict_calc['basis'] = basis
-        dict_calc['orbital'] = orbital
-        dict_calc['filename'] = filename
-        dict_calc['energy'] = energy
-        dict_calc['nuc_nuc'] = nuc_nuc
+            filename = os.path.normpath(filename)
+            if filename.split(os.sep, 1)[0] == os.pardir:
+                continue
+        paths.append(filename)
 
-        output.append(dict_calc)
+    with ThreadPoolExecutor(max_workers=_MAX_WORKERS) as executor:
+        scanned = list(executor.map(_scan_one, paths))
+    # finished calculations first
+    output = [result for status_tag in _RESULT_STATUSES for tag, result in scanned
+              if tag == status_tag and result is not None]
 
-    return output
+    # store as columns
+    columns = zip(*output) if output else [()] * len(_COLUMNS)
+    return {key: np.array(column, dtype=float if key in _FLOAT_COLUMNS else str)
+            for key, column in zip(_COLUMNS, columns)}
 
 
 def select_results(results: dict, system: str, basis: str, orbital: str, wfn: str):
@@ -128,51 +253,71 @@ def select_results(results: dict, system: str, basis: str, orbital: str, wfn: st
         Wavefunction of the calculation.
 
     """
-    output_x = []
-    output_y = []
-    output_error = []
-    for result in results:
-        if not (fnmatch.fnmatch(result['system'], system) and
-                result['basis'] == basis and
-                result['orbital'] == orbital and
-                result['wfn'] == wfn):
-            continue
-        xval = result['system'].rsplit('_', 1)[1]
-        output_x.append(xval)
-        output_y.append(float(result['energy']) + float(result['nuc_nuc']))
-        try:
-            output_error.append(result['sigma'])
-        except KeyError:
-            output_error.append(0)
-    return np.array(output_x, dtype=int), np.array(output_y, dtype=float), np.array(output_error, dtype=float)
+    systems = results['system']
+    # match the system pattern once for each distinct system
+    re_system = re.compile(fnmatch.translate(system))
+    unique_systems, inverse = np.unique(systems, return_inverse=True)
+    mask = np.array([re_system.match(name) is not None for name in unique_systems],
+                    dtype=bool)[inverse]
+    mask &= results['basis'] == basis
+    mask &= results['orbital'] == orbital
+    mask &= results['wfn'] == wfn
+
+    # np.char.rpartition fails on empty arrays (numpy 2), so split the selected names in Python
+    output_x = np.array([name.rsplit('_', 1)[1] for name in systems[mask]], dtype=int)
+    output_y = results['energy'][mask] + results['nuc_nuc'][mask]
+    output_error = results['sigma'][mask]
+    return output_x, output_y, output_error
 
 
 def trim(x, y, keep='all'):
-    new_x = []
-    new_y = []
-    for i in range(50):
-        if np.all(x != i):
-            continue
-        # most frequent value
-        y_vals = y[x == i]
-        # round to 8th decimal
-        y_vals = np.around(y_vals, 8)
-        # remove repeated numbers
-        y_vals_unique = np.unique(y_vals)
-        # find frequency
-        hist = np.array([np.sum(y_vals == i) for i in y_vals_unique])
-        # if all are kept
-        if keep == 'all':
-            new_x.extend([i] * y_vals_unique.size)
-            new_y.extend(y_vals_unique)
-        # if only minimm is kept
-        elif keep == 'min':
-            new_x.append(i)
-            new_y.append(min(y_vals_unique))
-        # if only the most frequent is kept
-        elif keep == 'frequent':
-            new_x.append(i)
-            new_y.append(y_vals_unique[np.argmax(hist)])
-
-    new_x, new_y = np.array(new_x), np.array(new_y)
-    return new_x, new_y
+    """Remove the repeated results at each point.
+
+    Parameters
+    ----------
+    x : np.ndarray(N,)
+        Indices of the points in the path.
+        Only the points 0 to 49 are kept.
+    y : np.ndarray(N,)
+        Values at each point.
+        Values are compared after rounding to the 8th decimal.
+    keep : str
+        Values that are kept at each point.
+        Use `all` to keep all unique values.
+        Use `min` to keep only the minimum value.
+        Use `frequent` to keep only the most frequent value (smallest value, if tied).
+
+    Returns
+    -------
+    new_x : np.ndarray(M,)
+        Indices of the points in the path.
+    new_y : np.ndarray(M,)
+        Values at each point.
+
+    """
+    x = np.asarray(x)
+    # round to 8th decimal
+    y = np.around(np.asarray(y, dtype=float), 8)
+    # only the first 50 points
+    in_range = np.isin(x, np.arange(50))
+    x, y = x[in_range], y[in_range]
+
+    # remove repeated numbers and find frequency (sorted by point, then by value)
+    unique_xy, hist = np.unique(np.column_stack((x, y)), axis=0, return_counts=True)
+    unique_x, unique_y = unique_xy[:, 0].astype(int), unique_xy[:, 1]
+    # first (smallest) unique value at each point
+    is_first = np.ones(unique_x.size, dtype=bool)
+    is_first[1:] = unique_x[1:] != unique_x[:-1]
+
+    # if all are kept
+    if keep == 'all':
+        return unique_x, unique_y
+    # if only minimm is kept
+    elif keep == 'min':
+        return unique_x[is_first], unique_y[is_first]
+    # if only the most frequent is kept
+    elif keep == 'frequent':
+        # within each point, sort by decreasing frequency (stable, so ties stay in increasing value)
+        order = np.lexsort((-hist, unique_x))
+        return unique_x[is_first], unique_y[order][is_first]
+    raise ValueError('`keep` must be one of `all`, `min`, and `frequent`.')
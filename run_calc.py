@@ -1,10 +1,155 @@
 import os
-import glob
+import re
+import json
 import shutil
+import hashlib
+import shlex
+import tempfile
+import warnings
 import subprocess
+from itertools import repeat
+from concurrent.futures import ThreadPoolExecutor
 import numpy as np
 import make_xyz
 from make_com import make_com
+from find_paths import find_paths
+
+
+# directory of a point in the path, `system_templates_index_basis` (system may contain underscores)
+_RE_DIRNAME = re.compile(
+    r'(?P<system>[^/]+)_(?P<templates>\d+)_(?P<index>\d+)_(?P<basis>[^_/]+)/?$'
+)
+# minutes in each unit of the time limit of a job
+_MINUTES_PER_UNIT = {'d': 24 * 60, 'h': 60, 'm': 1}
+# memory limit of a job, in MB or GB
+_RE_MEMORY = re.compile(r'\d+(MB|GB)')
+# number of threads used to write the files
+_MAX_WORKERS = min(32, (os.cpu_count() or 1) * 4)
+# file that marks a submitted calculation as finished, in the directory of the calculation
+_DONE_FILE = '.done_{}'
+# number of local commands (e.g. formchk) that are run at the same time by `run_calcs`
+_MAX_PROCESSES = os.cpu_count() or 1
+# shapes of the arrays in the npy files that have been read, by path and modification time
+_NPY_SHAPES = {}
+# nuclear repulsions in the HF energies files that have been read, by path and modification time
+_HF_CACHE = {}
+# digests of the xyz files that have been read, by absolute path (see `_xyz_digest`)
+_XYZ_DIGESTS = {}
+# xyz files made by the previous calls of `make_dirs` (see `_load_xyz_manifest`)
+_XYZ_MANIFEST = os.path.join('database', '.xyz_manifest.json')
+
+
+def _xyz_digest(xyzfile: str, stat: os.stat_result):
+    """Get the digest of the given xyz file.
+
+    Parameters
+    ----------
+    xyzfile : str
+        Absolute path to the xyz file.
+    stat : os.stat_result
+        Status of the xyz file.
+
+    Returns
+    -------
+    digest : bytes
+        BLAKE2b digest of the contents of the file.
+
+    Notes
+    -----
+    Digests are cached across calls so that the file is only read again if its size or
+    modification time has changed.
+
+    """
+    key = (stat.st_size, stat.st_mtime_ns)
+    cached = _XYZ_DIGESTS.get(xyzfile)
+    if cached is not None and cached[0] == key:
+        return cached[1]
+    with open(xyzfile, 'rb') as f:
+        digest = hashlib.blake2b(f.read(), digest_size=16).digest()
+    _XYZ_DIGESTS[xyzfile] = (key, digest)
+    return digest
+
+
+def _load_xyz_manifest():
+    """Load the record of the xyz files that were made by `make_dirs`.
+
+    Returns
+    -------
+    manifest : dict
+        Record of each call of `make_dirs`, keyed by `name_basis:start-end-num_steps`, with the
+        modification times of the templates (`templates`) and the directory, size, and digest of
+        the xyz file at each point (`points`).
+        Empty if the manifest does not exist or cannot be read.
+
+    """
+    try:
+        with open(_XYZ_MANIFEST) as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+
+def _save_xyz_manifest(manifest: dict):
+    """Save the record of the xyz files that were made by `make_dirs`.
+
+    See `_load_xyz_manifest` for details.
+
+    """
+    # replace the old manifest only once the new one is completely written
+    tmpfile = f'{_XYZ_MANIFEST}.{os.getpid()}'
+    with open(tmpfile, 'w') as f:
+        json.dump(manifest, f)
+    os.replace(tmpfile, _XYZ_MANIFEST)
+
+
+def _npy_shape(filename: str):
+    """Get the shape of the array stored in the given npy file without loading it.
+
+    Parameters
+    ----------
+    filename : str
+        Name of the npy file.
+
+    Returns
+    -------
+    shape : tuple of int
+        Shape of the array.
+
+    """
+    key = (filename, os.stat(filename).st_mtime_ns)
+    shape = _NPY_SHAPES.get(key)
+    if shape is None:
+        # only read the header
+        with open(filename, 'rb') as f:
+            version = np.lib.format.read_magic(f)
+            if version == (1, 0):
+                shape, _, _ = np.lib.format.read_array_header_1_0(f)
+            else:
+                shape, _, _ = np.lib.format.read_array_header_2_0(f)
+        _NPY_SHAPES[key] = shape
+    return shape
+
+
+def _nucnuc(filename: str):
+    """Get the nuclear repulsion energy stored in the given HF energies file.
+
+    Parameters
+    ----------
+    filename : str
+        Name of the npy file with the HF electronic and nuclear repulsion energies.
+
+    Returns
+    -------
+    nucnuc : float
+        Nuclear repulsion energy.
+
+    """
+    key = (filename, os.stat(filename).st_mtime_ns)
+    nucnuc = _HF_CACHE.get(key)
+    if nucnuc is None:
+        nucnuc = np.load(filename, mmap_mode='r')[1].item()
+        _HF_CACHE[key] = nucnuc
+    return nucnuc
 
 
 def make_dirs(name: str, start_template: str, end_template: str, basis: str, num_steps=10):
@@ -26,54 +171,148 @@ def make_dirs(name: str, start_template: str, end_template: str, basis: str, num
     Notes
     -----
     xyz file is stored as 'system.xyz2'.
+    gbs file is hard linked to the one in the `basis` directory, if possible.
+    If the same path was made before and its xyz files are still there, nothing is done (see
+    `_load_xyz_manifest`).
 
     """
     start_template_index = int(start_template.split('_')[1])
     end_template_index = int(end_template.split('_')[1])
 
-    dir_basename = os.path.join('database',
-                                f'{name}_{start_template_index}{end_template_index}_{{}}_{basis}')
-    for i, xyz in enumerate(make_xyz.xyz_from_templates(start_template, end_template, num_steps)):
-        dirname = dir_basename.format(i)
-
-        # if directory already exists
-        if os.path.isdir(dirname):
-            # find all others
-            other_dirnames = glob.glob(dir_basename.format('*'))
-            # check if xyz file matches any of the others
-            has_matched = False
-            for other_dirname in other_dirnames:
-                xyzfile = os.path.join(other_dirname, 'system.xyz2')
-                if os.path.isfile(xyzfile):
-                    with open(xyzfile, 'r') as f:
-                        if f.read() == xyz:
-                            has_matched = True
-                            break
-            # if xyz file does not match any of the others
+    prefix = f'{name}_{start_template_index}{end_template_index}_'
+    suffix = f'_{basis}'
+    dir_basename = os.path.join('database', f'{prefix}{{}}{suffix}')
+
+    # skip if the path was already made from the same templates
+    manifest = _load_xyz_manifest()
+    key = f'{name}_{basis}:{start_template_index}-{end_template_index}-{num_steps}'
+    templates_mtime = [os.stat(start_template).st_mtime_ns, os.stat(end_template).st_mtime_ns]
+    record = manifest.get(key)
+    if record is not None and record['templates'] == templates_mtime:
+        cwd = os.getcwd()
+        try:
+            for point in record['points']:
+                xyzfile = os.path.join(cwd, point['dirname'], 'system.xyz2')
+                stat = os.stat(xyzfile)
+                # points have the same size, so the contents are compared through their digests
+                if (stat.st_size != point['size'] or
+                        _xyz_digest(xyzfile, stat).hex() != point['digest']):
+                    break
             else:
-                # change the index (move to the end)
-                i += len(other_dirnames)
-                # update directory name
-                dirname = dir_basename.format(i)
+                return
+        except OSError:
+            pass
+    points = []
+
+    # find the existing directories (in one pass over the database directory)
+    with os.scandir('database') as it:
+        other_dirnames = {os.path.join('database', entry.name) for entry in it
+                          if len(entry.name) >= len(prefix) + len(suffix) and
+                          entry.name.startswith(prefix) and entry.name.endswith(suffix) and
+                          entry.is_dir()}
+    # group their xyz files by size
+    cwd = os.getcwd()
+    xyzfiles_by_size = {}
+    for other_dirname in other_dirnames:
+        xyzfile = os.path.join(cwd, other_dirname, 'system.xyz2')
+        try:
+            stat = os.stat(xyzfile)
+        except OSError:
+            continue
+        xyzfiles_by_size.setdefault(stat.st_size, []).append((xyzfile, stat, other_dirname))
+    # directories of the xyz files by their digests
+    xyz_hashes = {}
+    # directories that will be made and their xyz files (made once all of the points are known)
+    new_xyzs = []
 
-            if has_matched:
-                continue
+    for i, xyz in enumerate(make_xyz.xyz_from_templates(start_template, end_template, num_steps)):
+        xyz_bytes = xyz.encode()
+        # only the xyz files of the same size can match (hash them the first time they are needed)
+        same_size = xyzfiles_by_size.pop(len(xyz_bytes), [])
+        if len(same_size) == 1:
+            xyzfile, stat, other_dirname = same_size[0]
+            xyz_hashes[_xyz_digest(xyzfile, stat)] = other_dirname
+        elif same_size:
+            xyzfiles, stats, other_dirnames_same_size = zip(*same_size)
+            # read the files in parallel
+            with ThreadPoolExecutor(max_workers=_MAX_WORKERS) as executor:
+                xyz_hashes.update(zip(executor.map(_xyz_digest, xyzfiles, stats),
+                                      other_dirnames_same_size))
+        # if xyz file matches any of the existing directories
+        xyz_hash = hashlib.blake2b(xyz_bytes, digest_size=16).digest()
+        matched_dirname = xyz_hashes.get(xyz_hash)
+        if matched_dirname is not None:
+            points.append({'dirname': matched_dirname, 'size': len(xyz_bytes),
+                           'digest': xyz_hash.hex()})
+            continue
 
+        dirname = dir_basename.format(i)
+        # if directory already exists
+        if dirname in other_dirnames:
+            # change the index (move to the end)
+            i += len(other_dirnames)
+            # update directory name
+            dirname = dir_basename.format(i)
+        other_dirnames.add(dirname)
+        new_xyzs.append((dirname, xyz_bytes))
+        xyz_hashes[xyz_hash] = dirname
+        points.append({'dirname': dirname, 'size': len(xyz_bytes), 'digest': xyz_hash.hex()})
+
+    gbsfile = os.path.join('basis', basis + '.gbs')
+    # if basis set exists in basis directory
+    has_gbs = os.path.isfile(gbsfile)
+    if new_xyzs and not has_gbs:
+        warnings.warn(f'Cannot find `.gbs` file that correspond to the given basis, {basis}',
+                      stacklevel=2)
+    for dirname, xyz_bytes in new_xyzs:
         # create directory
         os.mkdir(dirname)
 
         # make xyz
         xyzfile = os.path.join(dirname, 'system.xyz2')
-        with open(xyzfile, 'w') as f:
-            f.write(xyz)
+        fd = os.open(xyzfile, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o644)
+        try:
+            os.write(fd, xyz_bytes)
+        finally:
+            os.close(fd)
 
         # make gbs
-        gbsfile = os.path.join('basis', basis + '.gbs')
-        # if basis set exists in basis directory
-        if os.path.isfile(gbsfile):
-            shutil.copyfile(gbsfile, os.path.join(dirname, basis + '.gbs'))
-        else:
-            print(f'Cannot find `.gbs` file that correspond to the given basis, {basis}')
+        if has_gbs:
+            # hard link if possible (e.g. same file system) to avoid copying the contents
+            try:
+                os.link(gbsfile, os.path.join(dirname, basis + '.gbs'))
+            except OSError:
+                shutil.copyfile(gbsfile, os.path.join(dirname, basis + '.gbs'))
+
+    manifest[key] = {'templates': templates_mtime, 'points': points}
+    _save_xyz_manifest(manifest)
+
+
+def _write_com(parent: str, memory: str, charge: int, multiplicity: int):
+    """Write the Gaussian com file for the given directory.
+
+    See `write_coms` for details.
+
+    """
+    re_dirname = _RE_DIRNAME.search(parent)
+    if re_dirname is None:
+        return
+    system, templates, index, basis = re_dirname.group('system', 'templates', 'index', 'basis')
+    basis = os.path.join('basis', basis)
+
+    dirname = os.path.join(parent, 'mo')
+    # make directory if it does not exist
+    os.makedirs(dirname, exist_ok=True)
+    # get xyz
+    with open(os.path.join(parent, 'system.xyz2'), 'r') as f:
+        xyz_content = f.read()
+    # get com content
+    com_content = make_com(xyz_content, basis, chkfile='hf_sp.chk', memory=memory,
+                           title=f'HF/{basis} calculation for {system}/{templates}/{index}',
+                           charge=charge, multiplicity=multiplicity)
+    # make com file
+    with open(os.path.join(dirname, 'hf_sp.com'), 'w')as f:
+        f.write(com_content)
 
 
 def write_coms(pattern: str, memory='2gb', charge=0, multiplicity=1):
@@ -97,30 +336,15 @@ def write_coms(pattern: str, memory='2gb', charge=0, multiplicity=1):
     Gaussian will only be used to run HF.
 
     """
-    for parent in glob.glob(pattern):
-        if not os.path.isdir(parent):
-            continue
-        system, templates, index, basis = os.path.split(parent)[1].split('_')
-        basis = os.path.join('basis', basis)
-
-        dirname = os.path.join(parent, 'mo')
-        # make directory if it does not exist
-        if not os.path.isdir(dirname):
-            os.mkdir(dirname)
-        # get xyz
-        with open(os.path.join(parent, 'system.xyz2'), 'r') as f:
-            xyz_content = f.read()
-        # get com content
-        com_content = make_com(xyz_content, basis, chkfile='hf_sp.chk', memory=memory,
-                               title=f'HF/{basis} calculation for {system}/{templates}/{index}',
-                               charge=charge, multiplicity=multiplicity)
-        # make com file
-        with open(os.path.join(dirname, 'hf_sp.com'), 'w')as f:
-            f.write(com_content)
+    # directories are independent of one another (threads overlap the file reads and writes)
+    parents = list(find_paths(pattern, only_dirs=True))
+    with ThreadPoolExecutor(max_workers=_MAX_WORKERS) as executor:
+        list(executor.map(_write_com, parents, repeat(memory), repeat(charge),
+                          repeat(multiplicity)))
 
 
 def make_orb_dirs(pattern: str, name: str):
-    for parent in glob.glob(pattern):
+    for parent in find_paths(pattern, only_dirs=True):
         newdir = os.path.join(parent, name)
         if os.path.isdir(newdir):
             continue
@@ -146,22 +370,15 @@ def make_wfn_dirs(pattern: str, wfn_name: str, num_runs: int):
         Number of calculations that will be run.
 
     """
-    for parent in glob.glob(pattern):
-        if not os.path.isdir(parent):
-            continue
+    for parent in find_paths(pattern, only_dirs=True):
         if not (os.path.isfile(os.path.join(parent, '..', 'mo', 'oneint.npy')) and
                 os.path.isfile(os.path.join(parent, '..', 'mo', 'twoint.npy'))):
             continue
 
         newdir = os.path.join(parent, wfn_name)
-        if not os.path.isdir(newdir):
-            os.mkdir(newdir)
-
+        os.makedirs(newdir, exist_ok=True)
         for i in range(num_runs):
-            try:
-                os.mkdir(os.path.join(newdir, str(i)))
-            except FileExistsError:
-                pass
+            os.makedirs(os.path.join(newdir, str(i)), exist_ok=True)
 
 
 def write_wfn_py(pattern: str, nelec: int, wfn_type: str, optimize_orbs: bool=False,
@@ -226,8 +443,6 @@ def write_wfn_py(pattern: str, nelec: int, wfn_type: str, optimize_orbs: bool=Fa
         Memory available to run the calculation.
 
     """
-    cwd = os.getcwd()
-
     if optimize_orbs:
         optimize_orbs = ['--optimize_orbs']
     else:
@@ -267,127 +482,298 @@ def write_wfn_py(pattern: str, nelec: int, wfn_type: str, optimize_orbs: bool=Fa
     if solver_kwargs is not None:
         kwargs += ['--solver_kwargs', solver_kwargs]
 
-    for parent in glob.glob(pattern):
-        if not os.path.isdir(parent):
-            continue
-
-        os.chdir(parent)
-
-        if filename is None:
-            filename = 'calculate.py'
-
+    if filename is None:
+        filename = 'calculate.py'
+
+    # arguments that do not depend on the orbitals
+    command_head = ['python', '/project/def-ayers/kimt33/fanpy/scripts/wfns_make_script.py',
+                    '--nelec', str(nelec)]
+    command_tail = [*optimize_orbs, '--wfn_type', wfn_type,
+                    '--pspace', *pspace_exc, '--objective', objective,
+                    '--solver', solver, *kwargs,
+                    *load_files,
+                    '--save_ham', 'hamiltonian.npy',
+                    '--save_wfn', 'wavefunction.npy',
+                    '--save_chk', 'checkpoint.npy',
+                    '--filename', filename, *memory]
+
+    # group the directories by the orbitals they use
+    parents_by_modir = {}
+    for parent in find_paths(pattern, only_dirs=True):
+        # resolve the path once and walk up to the orbital directory
+        parent = os.path.abspath(parent)
+        parent_parent = os.path.dirname(parent)
         # check if final directory is a number
-        _, dirname = os.path.split(parent)
         try:
-            int(dirname)
+            int(os.path.basename(parent))
         except ValueError:
-            oneint = os.path.abspath('../../mo/oneint.npy')
-            twoint = os.path.abspath('../../mo/twoint.npy')
-            hf_energies = os.path.abspath('../../mo/hf_energies.npy')
+            pass
         else:
-            oneint = os.path.abspath('../../../mo/oneint.npy')
-            twoint = os.path.abspath('../../../mo/twoint.npy')
-            hf_energies = os.path.abspath('../../../mo/hf_energies.npy')
+            parent_parent = os.path.dirname(parent_parent)
+        modir = os.path.join(os.path.dirname(parent_parent), 'mo')
+        parents_by_modir.setdefault(modir, []).append(parent)
+
+    for modir, parents in parents_by_modir.items():
+        oneint = os.path.join(modir, 'oneint.npy')
+        twoint = os.path.join(modir, 'twoint.npy')
+        hf_energies = os.path.join(modir, 'hf_energies.npy')
+
+        # read the integrals and the energies once for all of the directories that use them
+        nspin = _npy_shape(oneint)[1] * 2
+        nucnuc = _nucnuc(hf_energies)
+
+        command = [*command_head, '--nspin', str(nspin),
+                   '--one_int_file', oneint, '--two_int_file', twoint,
+                   '--nuc_repulsion', f'{nucnuc}', *command_tail]
+        for parent in parents:
+            subprocess.run(command, cwd=parent)
+
+
+def _submit_jobs(jobs: list, time: int, memory: str, outfile: str):
+    """Submit the given commands to Slurm, as one job array if there is more than one.
+
+    Parameters
+    ----------
+    jobs : list of 3-tuple of str, list of str, and str
+        Absolute path to the directory, the command that is run in it, and the file that is
+        created in it once the command succeeds, for each job.
+    time : int
+        Time limit of each job in minutes.
+    memory : str
+        Memory available to each job.
+    outfile : str
+        Name of the output file of each job, relative to its directory.
 
-        nspin = np.load(oneint).shape[1] * 2
-        nucnuc = np.load(hf_energies)[1]
+    Notes
+    -----
+    Slurm cannot give each task of the array its own output file, so the output of task `i` is
+    written to `sbatch_array_*/i.out`, a symbolic link to the output file in the directory of the
+    job. The directory `sbatch_array_*` is created in the current directory and must not be
+    removed until the jobs have started.
+
+    """
+    if not jobs:
+        return
+    # single job is submitted directly from its directory
+    if len(jobs) == 1:
+        dirname, command, donefile = jobs[0]
+        subprocess.run(['sbatch', f'--time={time}', f'--output={outfile}', f'--mem={memory}',
+                        '--account=rrg-ayers-ab',
+                        '--wrap', f'{shlex.join(command)} && touch {shlex.quote(donefile)}'],
+                       cwd=dirname)
+        return
+
+    arraydir = tempfile.mkdtemp(prefix='sbatch_array_', dir=os.getcwd())
+    for i, (dirname, _, _) in enumerate(jobs):
+        os.symlink(os.path.join(dirname, outfile), os.path.join(arraydir, f'{i}.out'))
+
+    arrayfile = os.path.join(arraydir, 'array.sh')
+    with open(arrayfile, 'w') as f:
+        f.write('#!/bin/bash\n')
+        f.write('case $SLURM_ARRAY_TASK_ID in\n')
+        for i, (dirname, command, donefile) in enumerate(jobs):
+            f.write(f'    {i}) cd {shlex.quote(dirname)} && {shlex.join(command)} && '
+                    f'touch {shlex.quote(donefile)} ;;\n')
+        f.write('esac\n')
+
+    subprocess.run(['sbatch', f'--array=0-{len(jobs) - 1}', f'--time={time}',
+                    f'--output={os.path.join(arraydir, "%a.out")}', f'--mem={memory}',
+                    '--account=rrg-ayers-ab', arrayfile])
+
+
+def _make_g16_command(workdir: str, filename: str):
+    """Make the command that runs Gaussian on the given com file.
+
+    Parameters
+    ----------
+    workdir : str
+        Directory of the file.
+    filename : str
+        Name of the file.
+
+    Returns
+    -------
+    command : list of str
+        Command that is run in the directory.
+
+    """
+    return ['g16', filename]
+
+
+def _make_formchk_command(workdir: str, filename: str):
+    """Make the command that formats the given Gaussian checkpoint file.
+
+    See `_make_g16_command` for details.
+
+    """
+    return ['formchk', filename]
 
-        subprocess.run(['python', '/project/def-ayers/kimt33/fanpy/scripts/wfns_make_script.py',
-                        '--nelec', str(nelec), '--nspin', str(nspin),
-                        '--one_int_file', oneint, '--two_int_file', twoint,
-                        '--nuc_repulsion', f'{nucnuc}', *optimize_orbs, '--wfn_type', wfn_type,
-                        '--pspace', *pspace_exc, '--objective', objective,
-                        '--solver', solver, *kwargs,
-                        *load_files,
-                        '--save_ham', 'hamiltonian.npy',
-                        '--save_wfn', 'wavefunction.npy',
-                        '--save_chk', 'checkpoint.npy',
-                        '--filename', filename, *memory])
 
-        os.chdir(cwd)
+def _make_horton_command(workdir: str, filename: str):
+    """Make the command that extracts the integrals from the given formatted checkpoint file.
 
+    See `_make_g16_command` for details.
 
-def run_calcs(pattern: str, time='1d', memory='2GB', outfile='outfile'):
+    """
+    return [os.environ.get('HORTONPYTHON'),
+            '/project/def-ayers/kimt33/fanpy/scripts/horton_gaussian_fchk.py',
+            'hf_energies.npy', 'oneint.npy', 'twoint.npy', 'fchk_file', filename]
+
+
+def _make_wfn_script(workdir: str, filename: str):
+    """Write the script that runs the wavefunction calculation(s).
+
+    If the given file is the python script, the calculation is run in each of the subdirectories.
+
+    See `_make_g16_command` for details.
+
+    """
+    if os.path.splitext(filename)[1] == '.py':
+        with open(os.path.join(workdir, 'results.sh'), 'w') as f:
+            f.write('#!/bin/bash\n')
+            f.write('cwd=$PWD\n')
+            # fail if any of the calculations fails (so that the job is not marked as done)
+            f.write('status=0\n')
+            f.write('for i in */; do\n')
+            f.write('    cd $i\n')
+            f.write('    python ../calculate.py > results.out || status=1\n')
+            f.write('    cd $cwd\n')
+            f.write('done\n')
+            f.write('exit $status\n')
+    else:
+        with open(os.path.join(workdir, 'results.sh'), 'w') as f:
+            f.write('#!/bin/bash\n')
+            f.write(f'python ../calculate.py\n')
+    return ['bash', 'results.sh']
+
+
+# commands for the files in the `mo` directory by their extension (and whether they are submitted)
+_MO_COMMANDS = {
+    '.com': (_make_g16_command, True),
+    '.chk': (_make_formchk_command, False),
+    '.fchk': (_make_horton_command, False),
+}
+
+
+def _parse_time(time: str):
+    """Convert the given time limit to minutes.
+
+    Parameters
+    ----------
+    time : str
+        Time limit in minutes, hours, or days (e.g. 1440m, 24h, 1d).
+
+    Returns
+    -------
+    time : int
+        Time limit in minutes.
+
+    """
+    time = time.lower()
+    try:
+        return int(time[:-1]) * _MINUTES_PER_UNIT[time[-1:]]
+    except KeyError:
+        raise ValueError('Time must be given in minutes, hours, or days '
+                         '(e.g. 1440m, 24h, 1d).') from None
+
+
+def run_calcs(pattern: str, time='1d', memory='2GB', outfile='outfile', resubmit=False):
     """Run the calculations for the selected files/directories.
 
     Parameters
     ----------
     pattern : str
         Pattern for selecting the files.
+    resubmit : bool
+        If True, calculations that have already finished are submitted again.
+        By default, they are skipped.
 
     Notes
     -----
     Can only execute at the base directory.
+    Submitted calculations that have finished successfully are marked with the file
+    `.done_<filename>` in their directory. They are not submitted again unless the marker is
+    older than the input of the calculation (the com file or `calculate.py`), e.g. because the
+    input was written again with different options.
+    Local commands (e.g. formchk) that fail are reported with a warning and the calculations are
+    submitted regardless. If a command cannot be started, the function raises once the running
+    commands have finished, without submitting anything.
 
     """
     cwd = os.getcwd()
+    # files within the current directory start with this prefix once they are made absolute
+    cwd_prefix = os.path.join(cwd, '')
 
-    time = time.lower()
-    if time[-1] == 'd':
-        time = int(time[:-1]) * 24 * 60
-    elif time[-1] == 'h':
-        time = int(time[:-1]) * 60
-    elif time[-1] == 'm':
-        time = int(time[:-1])
-    else:
-        raise ValueError('Time must be given in minutes, hours, or days (e.g. 1440m, 24h, 1d).')
+    time = _parse_time(time)
 
     memory = memory.upper()
-    if memory[-2:] not in ['MB', 'GB']:
+    if not _RE_MEMORY.fullmatch(memory):
         raise ValueError('Memory must be given as a MB or GB (e.g. 1024MB, 1GB)')
 
-    for filename in glob.glob(pattern):
-        if os.path.commonpath([cwd, os.path.abspath(filename)]) != cwd:
-            continue
-        filename = os.path.abspath(filename)[len(cwd)+1:]
+    # commands that will be submitted (with the directories in which they are run)
+    jobs = []
+    # local commands that are running, by directory (one at a time in each directory, since the
+    # outputs of one command can be the inputs of the next)
+    running = {}
+    # local commands that have been started (with the directories in which they are run)
+    started = []
+    # if a command cannot be made or started, the commands that are running are still waited on
+    # (and nothing is submitted)
+    try:
+        for filename in find_paths(pattern):
+            filename = os.path.abspath(filename)
+            if not filename.startswith(cwd_prefix):
+                continue
+            filename = filename[len(cwd_prefix):]
 
-        _, _, orbital, *wfn = filename.split(os.sep)
-        if os.path.isdir(filename):
-            os.chdir(filename)
-        else:
-            dirname, filename = os.path.split(filename)
-            os.chdir(dirname)
-        submit_job = False
-
-        if orbital == 'mo' and os.path.splitext(filename)[1] == '.com':
-            # write script (because sbatch only takes one command)
-            with open('hf_sp.sh', 'w') as f:
-                f.write('#!/bin/bash\n')
-                f.write(f'g16 {filename}\n')
-            command = ['hf_sp.sh']
-            submit_job = True
-        elif orbital == 'mo' and os.path.splitext(filename)[1] == '.chk':
-            command = ['formchk', filename]
-            submit_job = False
-        elif orbital == 'mo' and os.path.splitext(filename)[1] == '.fchk':
-            command = [os.environ.get('HORTONPYTHON'),
-                       '/project/def-ayers/kimt33/fanpy/scripts/horton_gaussian_fchk.py',
-                       'hf_energies.npy', 'oneint.npy', 'twoint.npy', 'fchk_file', filename]
-            submit_job = False
-        elif len(wfn) == 2:
-            if os.path.splitext(filename)[1] == '.py':
-                with open('results.sh', 'w') as f:
-                    f.write('#!/bin/bash\n')
-                    f.write('cwd=$PWD\n')
-                    f.write('for i in */; do\n')
-                    f.write('    cd $i\n')
-                    f.write('    python ../calculate.py > results.out\n')
-                    f.write('    cd $cwd\n')
-                    f.write('done\n')
+            _, _, orbital, *wfn = filename.split(os.sep)
+            if os.path.isdir(filename):
+                workdir = filename
             else:
-                with open('results.sh', 'w') as f:
-                    f.write('#!/bin/bash\n')
-                    f.write(f'python ../calculate.py\n')
-            command = ['results.sh']
-            submit_job = True
-
-        # print(' '.join(['sbatch', f'--time={time}', f'--output={outfile}', f'--mem={memory}',
-        #                 '--account=rrg-ayers-ab', command]))
-        if submit_job:
-            subprocess.run(['sbatch', f'--time={time}', f'--output={outfile}', f'--mem={memory}',
-                            '--account=rrg-ayers-ab', *command])
-        else:
-            subprocess.run(command)
-
-        # change directory
-        os.chdir(cwd)
+                workdir, filename = os.path.split(filename)
+            # find how the file is run
+            extension = os.path.splitext(filename)[1]
+            make_command, submit_job = _MO_COMMANDS.get(extension, (None, False))
+            if orbital != 'mo' or make_command is None:
+                if len(wfn) != 2:
+                    continue
+                make_command, submit_job = _make_wfn_script, True
+
+            # filename is the whole path if a directory was matched
+            donefile = _DONE_FILE.format(os.path.basename(filename))
+            # skip calculations that have finished since their input was last written
+            if submit_job and not resubmit:
+                if workdir == filename:
+                    inputfile = os.path.join(workdir, os.pardir, 'calculate.py')
+                else:
+                    inputfile = os.path.join(workdir, filename)
+                try:
+                    is_done = (os.stat(os.path.join(workdir, donefile)).st_mtime_ns >=
+                               os.stat(inputfile).st_mtime_ns)
+                except OSError:
+                    is_done = False
+                if is_done:
+                    continue
+            command = make_command(workdir, filename)
+
+            if submit_job:
+                jobs.append((os.path.join(cwd, workdir), command, donefile))
+            else:
+                if workdir in running:
+                    running.pop(workdir).wait()
+                elif len(running) >= _MAX_PROCESSES:
+                    # wait for the oldest command
+                    running.pop(next(iter(running))).wait()
+                running[workdir] = subprocess.Popen(command, cwd=workdir)
+                started.append((workdir, command, running[workdir]))
+    finally:
+        for _, _, process in started:
+            process.wait()
+
+    # report the local commands that failed (the jobs are submitted regardless)
+    for workdir, command, process in started:
+        if process.returncode != 0:
+            warnings.warn(f'Command `{shlex.join(map(str, command))}` in {workdir} failed with '
+                          f'exit status {process.returncode}', stacklevel=2)
+
+    _submit_jobs(jobs, time, memory, outfile)